@@ -24,10 +24,6 @@ def write_text_file(file_path, content):
     with open(file_path, 'w', encoding = 'utf-8') as file_connection:
         file_connection.write(content)
 
-TEX_FILE = read_text_file(TEX_FILE_PATH)
-TEX_LINES = TEX_FILE.split('\n')
-
-
 def find_positions(lines, regex_pattern):
     positions = list()
     pattern = re.compile(regex_pattern)
@@ -39,10 +35,6 @@ def find_positions(lines, regex_pattern):
     return positions
 
 
-BEGIN_POSITIONS = find_positions(TEX_LINES, BEGIN_VERBATIM_REGEX)
-END_POSITIONS = find_positions(TEX_LINES, END_VERBATIM_REGEX)
-
-
 def build_chunk_ranges(begin_positions, end_positions):
     chunk_ranges = list()
     for b, e in zip(begin_positions, end_positions):
@@ -50,11 +42,10 @@ def build_chunk_ranges(begin_positions, end_positions):
     return chunk_ranges
 
 
-CHUNK_RANGES = build_chunk_ranges(BEGIN_POSITIONS, END_POSITIONS)
-def collect_chunk_content(chunk_range):
+def collect_chunk_content(tex_lines, chunk_range):
     s = chunk_range[0]
     e = chunk_range[-1]
-    return '\n'.join(TEX_LINES[s:e])
+    return '\n'.join(tex_lines[s:e])
 
 
 def is_dataframe_output(text):
@@ -94,39 +85,52 @@ def adjust_chunk_output(text_to_adjust):
 
 
 
-adjusted_lines = list()
-last_index = 0
-for chunk_range in CHUNK_RANGES:
-    start_index = chunk_range[0]
-    end_index = chunk_range[-1]
-    print(f"[INFO]: Found chunk output at indexes {start_index}, {end_index}")
-    chunk_output = collect_chunk_content(chunk_range)
+def clean_tex_lines(tex_lines):
+    begin_positions = find_positions(tex_lines, BEGIN_VERBATIM_REGEX)
+    end_positions = find_positions(tex_lines, END_VERBATIM_REGEX)
+    chunk_ranges = build_chunk_ranges(begin_positions, end_positions)
 
-    if is_stage_output(chunk_output):
-        # Remove stage outputs
-        print("[INFO]: Found a stage output at: ", start_index)
+    adjusted_lines = list()
+    last_index = 0
+    for chunk_range in chunk_ranges:
+        start_index = chunk_range[0]
+        end_index = chunk_range[-1]
+        print(f"[INFO]: Found chunk output at indexes {start_index}, {end_index}")
+        chunk_output = collect_chunk_content(tex_lines, chunk_range)
+
+        if is_stage_output(chunk_output):
+            # Remove stage outputs
+            print("[INFO]: Found a stage output at: ", start_index)
+            adjusted_lines.append('\n'.join([
+                '\n'.join(tex_lines[last_index:(start_index - 1)])
+            ]))
+            last_index = end_index + 1
+            continue
+
+        # The chunk is not a stage output
+        adjusted_output = adjust_chunk_output(chunk_output)
         adjusted_lines.append('\n'.join([
-            '\n'.join(TEX_LINES[last_index:(start_index - 1)])
+            '\n'.join(tex_lines[last_index:start_index]),
+            adjusted_output,
+            tex_lines[end_index]
         ]))
         last_index = end_index + 1
-        continue
 
-    # The chunk is not a stage output
-    adjusted_output = adjust_chunk_output(chunk_output)
+
+    # Append the last lines of the document
     adjusted_lines.append('\n'.join([
-        '\n'.join(TEX_LINES[last_index:start_index]),
-        adjusted_output,
-        TEX_LINES[end_index]
+        '\n'.join(tex_lines[last_index:])
     ]))
-    last_index = end_index + 1
+
+    return '\n'.join(adjusted_lines)
 
 
-# Append the last lines of the document
-adjusted_lines.append('\n'.join([
-    '\n'.join(TEX_LINES[last_index:])
-]))
+def clean_tex_file(tex_path = TEX_FILE_PATH, output_path = 'tex_adjusted.tex'):
+    tex_lines = read_text_file(tex_path).split('\n')
+    adjusted_lines = clean_tex_lines(tex_lines)
+    write_text_file(output_path, adjusted_lines)
+    print(f"[INFO]: Rewrited tex file {output_path}")
 
-adjusted_lines = '\n'.join(adjusted_lines)
-write_text_file('tex_adjusted.tex', adjusted_lines)
-print(f"[INFO]: Rewrited tex file {'tex_adjusted.tex'}")
 
+if __name__ == '__main__':
+    clean_tex_file()
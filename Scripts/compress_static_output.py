@@ -0,0 +1,259 @@
+import os
+import re
+import gzip
+import json
+import hashlib
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# This script should be executed from the root folder of the project,
+# as the last step after `quarto render` (i.e. after `optimize_images.py`),
+# because it rewrites and compresses the HTML files inside `docs/`.
+DOCS_FOLDER = "./docs/"
+SITE_LIBS_FOLDER = "./docs/site_libs/"
+MANIFEST_PATH = "./.cache/static-manifest.json"
+# Number of characters of the content hash used in the asset file names
+HASH_LENGTH = 10
+ASSET_EXTENSIONS = ('.css', '.js')
+PAGE_EXTENSIONS = ('.html', '.json')
+FINGERPRINT_REGEX = r'\.[0-9a-f]{%d}$' % HASH_LENGTH
+PROTECTED_BLOCKS_REGEX = r'(<(pre|textarea|script|style)\b.*?</\2\s*>)'
+CSS_TOKENS_REGEX = r'("(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|/\*.*?\*/)'
+REFERENCE_REGEX = r'(\b(?:src|href)=")([^"#?]+)([^"]*")'
+
+
+def read_bytes(path):
+    with open(path, 'rb') as file_connection:
+        content = file_connection.read()
+    return content
+
+def write_bytes(path, content):
+    with open(path, 'wb') as file_connection:
+        file_connection.write(content)
+    return True
+
+
+def hash_bytes(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def read_manifest(path):
+    if not Path(path).exists():
+        return {'pages': {}}
+    return json.loads(read_bytes(path).decode('utf8'))
+
+def write_manifest(path, manifest):
+    Path(path).parent.mkdir(parents = True, exist_ok = True)
+    write_bytes(path, json.dumps(manifest, indent = 2, sort_keys = True).encode('utf8'))
+
+
+
+def minify_html(text):
+    # The contents of <pre>, <textarea>, <script> and <style> are kept as is,
+    # because whitespace is meaningful inside these elements
+    blocks = re.split(PROTECTED_BLOCKS_REGEX, text, flags = re.DOTALL | re.IGNORECASE)
+    minified = list()
+    i = 0
+    while i < len(blocks):
+        block = blocks[i]
+        if i % 3 == 1:
+            minified.append(block)
+            i += 2
+            continue
+
+        block = re.sub(r'<!--(?!\[if).*?-->', '', block, flags = re.DOTALL)
+        lines = [line.strip() for line in block.split('\n')]
+        minified.append('\n'.join(line for line in lines if line != ''))
+        i += 1
+
+    return ''.join(minified)
+
+
+def collapse_css_whitespace(text):
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,])\s*', r'\1', text)
+    return text.replace(';}', '}')
+
+
+def minify_css(text):
+    # String literals are kept as is. Comments are replaced by a space
+    # (except the `/*! ... */` license comments), before the whitespace
+    # around the other characters is collapsed
+    tokens = re.split(CSS_TOKENS_REGEX, text, flags = re.DOTALL)
+    minified = list()
+    buffer = ''
+    for i, token in enumerate(tokens):
+        is_comment = token.startswith('/*')
+        if i % 2 == 0 or (is_comment and not token.startswith('/*!')):
+            buffer += token if i % 2 == 0 else ' '
+            continue
+        minified.append(collapse_css_whitespace(buffer))
+        minified.append(token)
+        buffer = ''
+
+    minified.append(collapse_css_whitespace(buffer))
+    return ''.join(minified).strip()
+
+
+def minify_json(text):
+    return json.dumps(json.loads(text), ensure_ascii = False, separators = (',', ':'))
+
+
+def minify(path, content):
+    name = Path(path).name
+    # Files that were already minified by their authors are not touched.
+    # JavaScript files are not minified either, because doing it safely needs
+    # a real JS parser (strings, regexes and template literals), so they
+    # only get the `.gz` and `.br` compression
+    if '.min.' in name or name.endswith('.js'):
+        return content
+    text = content.decode('utf8')
+    if name.endswith('.html'):
+        text = minify_html(text)
+    elif name.endswith('.css'):
+        text = minify_css(text)
+    elif name.endswith('.json'):
+        text = minify_json(text)
+    return text.encode('utf8')
+
+
+
+def compressed_paths(path):
+    paths = [f"{path}.gz"]
+    if brotli is not None:
+        paths.append(f"{path}.br")
+    return paths
+
+
+def write_compressed(path, content):
+    # `mtime = 0` makes the output reproducible between builds
+    gz_content = gzip.compress(content, compresslevel = 9, mtime = 0)
+    write_bytes(f"{path}.gz", gz_content)
+    if brotli is not None:
+        br_content = brotli.compress(content, quality = 11)
+        write_bytes(f"{path}.br", br_content)
+
+
+def is_fingerprinted(path):
+    stem = Path(path).stem
+    return re.search(FINGERPRINT_REGEX, stem) is not None
+
+
+def get_source_path(path):
+    # `quarto.caf90641b0.js` is the fingerprinted copy of `quarto.js`
+    if not is_fingerprinted(path):
+        return path
+    asset_path = Path(path)
+    stem = re.sub(FINGERPRINT_REGEX, '', asset_path.stem)
+    return os.path.normpath(asset_path.with_name(stem + asset_path.suffix))
+
+
+def get_fingerprinted_files(folder):
+    files = [x for x in sorted(Path(folder).rglob('*')) if x.is_file()]
+    return [os.path.normpath(x) for x in files if x.suffix in ASSET_EXTENSIONS and is_fingerprinted(x)]
+
+
+def remove_stale_assets(folder, asset_map):
+    # Fingerprinted copies of old versions of the assets are not referenced
+    # by the pages anymore, so they are deleted with their compressed files
+    current_targets = set(asset_map.values())
+    for path in get_fingerprinted_files(folder):
+        if path in current_targets:
+            continue
+        for stale_path in [path, f"{path}.gz", f"{path}.br"]:
+            if Path(stale_path).exists():
+                os.remove(stale_path)
+        print(f"[INFO]: Removed stale asset {path}...")
+
+
+def get_asset_files(folder):
+    files = [x for x in sorted(Path(folder).rglob('*')) if x.is_file()]
+    return [str(x) for x in files if x.suffix in ASSET_EXTENSIONS and not is_fingerprinted(x)]
+
+
+def get_page_files(folder):
+    files = [x for x in sorted(Path(folder).rglob('*')) if x.is_file()]
+    files = [x for x in files if x.suffix in PAGE_EXTENSIONS]
+    return [str(x) for x in files if Path(SITE_LIBS_FOLDER) not in x.parents]
+
+
+def fingerprint_asset(path):
+    content = read_bytes(path)
+    content_hash = hash_bytes(content)[:HASH_LENGTH]
+    asset_path = Path(path)
+    target = str(asset_path.with_name(f"{asset_path.stem}.{content_hash}{asset_path.suffix}"))
+    outputs = [target] + compressed_paths(target)
+    # The hash is taken from the original file, so an unchanged
+    # asset always maps to the same (already processed) target
+    if all(Path(x).exists() for x in outputs):
+        return target, False
+
+    minified = minify(path, content)
+    write_bytes(target, minified)
+    write_compressed(target, minified)
+    return target, True
+
+
+def rewrite_references(text, page_path, asset_map):
+    page_folder = Path(page_path).parent
+
+    def replace(match):
+        reference = match.group(2)
+        if re.match(r'^[a-z]+:|^/', reference):
+            return match.group(0)
+        # Pages rewritten by a previous build point to an older fingerprinted
+        # copy, so the reference is mapped back to its source file first
+        resolved = get_source_path(os.path.normpath(page_folder / reference))
+        target = asset_map.get(resolved)
+        if target is None:
+            return match.group(0)
+        new_reference = os.path.relpath(target, page_folder).replace(os.sep, '/')
+        return match.group(1) + new_reference + match.group(3)
+
+    return re.sub(REFERENCE_REGEX, replace, text)
+
+
+def process_page(path, asset_map, assets_digest, manifest):
+    content = read_bytes(path)
+    entry = manifest['pages'].get(path)
+    outputs_exist = all(Path(x).exists() for x in compressed_paths(path))
+    if entry and entry['hash'] == hash_bytes(content) and entry['assets'] == assets_digest and outputs_exist:
+        return False
+
+    if path.endswith('.html'):
+        text = rewrite_references(content.decode('utf8'), path, asset_map)
+        content = text.encode('utf8')
+    content = minify(path, content)
+    write_bytes(path, content)
+    write_compressed(path, content)
+    manifest['pages'][path] = {'hash': hash_bytes(content), 'assets': assets_digest}
+    return True
+
+
+
+if __name__ == '__main__':
+    if brotli is None:
+        print("[WARNING]: `brotli` package not found, skipping the `.br` files...")
+
+    manifest = read_manifest(MANIFEST_PATH)
+    asset_map = dict()
+    for path in get_asset_files(SITE_LIBS_FOLDER):
+        target, processed = fingerprint_asset(path)
+        asset_map[os.path.normpath(path)] = os.path.normpath(target)
+        if processed:
+            print(f"[INFO]: Fingerprinted {path} as {target}...")
+
+    assets_digest = hash_bytes(json.dumps(asset_map, sort_keys = True).encode('utf8'))
+    for path in get_page_files(DOCS_FOLDER):
+        path = os.path.normpath(path)
+        if process_page(path, asset_map, assets_digest, manifest):
+            print(f"[INFO]: Minified and compressed {path}...")
+        else:
+            print(f"[INFO]: {path} did not change since the last build, skipping...")
+
+    remove_stale_assets(SITE_LIBS_FOLDER, asset_map)
+    write_manifest(MANIFEST_PATH, manifest)
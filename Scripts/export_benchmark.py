@@ -0,0 +1,229 @@
+import os
+import math
+import time
+import shutil
+import statistics
+from pathlib import Path
+from itertools import product
+
+from pyspark.sql import SparkSession
+
+# This script benchmarks the export strategies presented at the chapter
+# "Exporting data out of Spark" (`Chapters/07-export.qmd`). It writes a
+# DataFrame with different file formats, compression codecs and number of
+# partitions, measures how long each write takes, how many files and bytes
+# it generates, and how long Spark takes to read the data back. It should
+# be executed from the root folder of the project.
+DATA_PATH = "./Data/transf_reform.csv"
+OUTPUT_FOLDER = "./export_benchmark"
+# Size of the files that the partition advisor tries to reach
+TARGET_FILE_SIZE = 128 * 1024 * 1024
+DEFAULT_CODECS = {
+    'csv': ['none', 'gzip'],
+    'json': ['none', 'gzip'],
+    'parquet': ['snappy', 'gzip'],
+    'orc': ['snappy', 'zlib']
+}
+# Formats that do not store the schema of the data inside the files
+TEXT_FORMATS = ('csv', 'json')
+
+
+
+def read_transf_reform(spark, path = DATA_PATH):
+    return spark.read\
+        .option("sep", ";")\
+        .option("header", True)\
+        .csv(path)
+
+
+def scale_dataframe(spark, df, factor):
+    # Each row of `df` is repeated `factor` times, which is useful to
+    # benchmark a dataset bigger than the small files at `Data/`
+    return df.crossJoin(spark.range(factor)).drop('id')
+
+
+def is_data_file(path):
+    # Spark also writes placeholder (`_SUCCESS`) and checksum (`.crc`) files
+    name = Path(path).name
+    return not name.startswith(('_', '.'))
+
+
+def get_folder_stats(folder):
+    n_files = 0
+    n_bytes = 0
+    # With `partitionBy()`, the files are spread across one folder
+    # for each value of the partition columns
+    data_folders = set()
+    for root, _, files in os.walk(folder):
+        for file in files:
+            if is_data_file(file):
+                n_files += 1
+                n_bytes += os.path.getsize(os.path.join(root, file))
+                data_folders.add(root)
+    return n_files, n_bytes, max(1, len(data_folders))
+
+
+def prepare_partitions(df, n_partitions = None, method = 'repartition'):
+    if n_partitions is None:
+        return df
+    if method == 'repartition':
+        return df.repartition(n_partitions)
+    if method == 'coalesce':
+        return df.coalesce(n_partitions)
+    raise Exception(f"Method `{method}` is not supported! Use `repartition` or `coalesce`.")
+
+
+
+def write_dataframe(df, format, path, compression = 'none', partition_by = None):
+    writer = df.write\
+        .mode("overwrite")\
+        .format(format)\
+        .option("compression", compression)
+    if format == 'csv':
+        writer = writer.option("header", True)
+    if partition_by:
+        writer = writer.partitionBy(partition_by)
+    writer.save(path)
+
+
+def read_back(spark, df, format, path):
+    reader = spark.read.format(format)
+    if format in TEXT_FORMATS:
+        reader = reader.schema(df.schema)
+    if format == 'csv':
+        reader = reader.option("header", True)
+    # The `noop` format forces Spark to read and parse all the rows
+    # of the files, without writing the result anywhere
+    reader.load(path).write.format("noop").mode("overwrite").save()
+
+
+def benchmark_export(spark, df, format, compression = 'none', n_partitions = None,
+                     method = 'repartition', partition_by = None, output_folder = OUTPUT_FOLDER,
+                     repeats = 3):
+    if repeats < 1:
+        raise Exception(f"`repeats` must be at least 1, got {repeats}.")
+    partition_by = [partition_by] if isinstance(partition_by, str) else partition_by
+    df = prepare_partitions(df, n_partitions, method)
+    name = f"{format}-{compression}-{method}-{n_partitions}-{'_'.join(partition_by or ['none'])}"
+    path = os.path.join(output_folder, name)
+
+    # Each scenario is executed `repeats` times, and the median of the
+    # timings is reported, so a single slow execution does not skew the results
+    write_times = list()
+    read_times = list()
+    for i in range(repeats):
+        start = time.perf_counter()
+        write_dataframe(df, format, path, compression, partition_by)
+        write_times.append(time.perf_counter() - start)
+
+        n_files, n_bytes, n_folders = get_folder_stats(path)
+
+        start = time.perf_counter()
+        read_back(spark, df, format, path)
+        read_times.append(time.perf_counter() - start)
+
+        shutil.rmtree(path, ignore_errors = True)
+    return {
+        'format': format,
+        'compression': compression,
+        'method': method,
+        'partitions': df.rdd.getNumPartitions(),
+        'partition_by': ', '.join(partition_by or []),
+        'folders': n_folders,
+        'files': n_files,
+        'bytes': n_bytes,
+        'repeats': repeats,
+        'write_seconds': round(statistics.median(write_times), 3),
+        'read_seconds': round(statistics.median(read_times), 3)
+    }
+
+
+def run_benchmark(spark, df, formats = None, codecs = None, partition_counts = (None,),
+                  methods = ('repartition',), partition_by_options = (None,),
+                  output_folder = OUTPUT_FOLDER, repeats = 3):
+    formats = formats or list(DEFAULT_CODECS.keys())
+    codecs = codecs or DEFAULT_CODECS
+    # The DataFrame is cached, so the time spent reading the source
+    # data is not counted in the results
+    df = df.cache()
+    df.count()
+
+    results = list()
+    for format in formats:
+        # The first write of each format pays for the JVM warm-up (JIT, code
+        # generation, loading of the format classes), so it is discarded
+        print(f"[INFO]: Warming up the {format} writer and reader...")
+        benchmark_export(spark, df, format, codecs[format][0], output_folder = output_folder, repeats = 1)
+
+        scenarios = product(codecs[format], partition_counts, methods, partition_by_options)
+        for compression, n_partitions, method, partition_by in scenarios:
+            print(f"[INFO]: Benchmarking {format} ({compression}) with {method}({n_partitions}), partitionBy({partition_by})...")
+            results.append(benchmark_export(
+                spark, df, format, compression, n_partitions,
+                method, partition_by, output_folder, repeats
+            ))
+
+    df.unpersist()
+    return results
+
+
+
+def recommend_partitions(results, target_file_size = TARGET_FILE_SIZE):
+    # The total size of the output barely depends on the number of partitions,
+    # so the size of the biggest output of each format/codec/partitionBy is
+    # used to calculate how many files of `target_file_size` bytes are needed.
+    # With `partitionBy()`, each of the N partitions of the DataFrame writes one
+    # file inside every partition folder, so the size is divided by the number
+    # of folders to get the number of files needed inside each folder
+    recommendations = dict()
+    for result in results:
+        key = (result['format'], result['compression'], result['partition_by'])
+        previous = recommendations.get(key)
+        if previous and previous['bytes'] >= result['bytes']:
+            continue
+        n_bytes = result['bytes']
+        n_folders = result['folders']
+        bytes_per_folder = n_bytes / n_folders
+        n_partitions = max(1, math.ceil(bytes_per_folder / target_file_size))
+        recommendations[key] = {
+            'format': result['format'],
+            'compression': result['compression'],
+            'partition_by': result['partition_by'],
+            'bytes': n_bytes,
+            'folders': n_folders,
+            'recommended_partitions': n_partitions,
+            'estimated_file_size': math.ceil(bytes_per_folder / n_partitions)
+        }
+    return list(recommendations.values())
+
+
+def print_results(rows):
+    if len(rows) == 0:
+        return
+    columns = list(rows[0].keys())
+    widths = [max(len(column), *[len(str(row[column])) for row in rows]) for column in columns]
+    separator = '+' + '+'.join('-' * width for width in widths) + '+'
+    print(separator)
+    print('|' + '|'.join(column.rjust(width) for column, width in zip(columns, widths)) + '|')
+    print(separator)
+    for row in rows:
+        print('|' + '|'.join(str(row[column]).rjust(width) for column, width in zip(columns, widths)) + '|')
+    print(separator)
+
+
+
+if __name__ == '__main__':
+    spark = SparkSession.builder.getOrCreate()
+    spark.sparkContext.setLogLevel("OFF")
+
+    transf = read_transf_reform(spark)
+    transf = scale_dataframe(spark, transf, 50)
+    results = run_benchmark(
+        spark, transf,
+        partition_counts = [1, 4, 16],
+        methods = ['repartition', 'coalesce'],
+        partition_by_options = [None, 'country']
+    )
+    print_results(results)
+    print_results(recommend_partitions(results))
+    shutil.rmtree(OUTPUT_FOLDER, ignore_errors = True)
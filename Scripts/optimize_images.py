@@ -0,0 +1,286 @@
+import io
+import os
+import re
+import json
+import shutil
+import hashlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageCms
+from bs4 import BeautifulSoup
+
+# This script should be executed from the root folder of the project,
+# after the book is rendered with `quarto render`. It optimizes the images
+# that Quarto copied into the `docs/` folder, and it never touches the
+# original images at `Figures/` and `Cover/`.
+DOCS_FOLDER = "./docs/"
+IMAGE_FOLDERS = ["./docs/Figures/", "./docs/Cover/"]
+CACHE_FOLDER = "./.cache/images/"
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# Widths (in pixels) of the responsive WebP variants of each image
+RESPONSIVE_WIDTHS = [480, 960, 1440]
+# Width of the main text column of the book, used in the `sizes` attribute
+CONTENT_WIDTH = 800
+JPEG_QUALITY = 85
+WEBP_QUALITY = 85
+# Bump this number whenever the settings above change, so that the
+# cached results are not reused anymore
+CACHE_VERSION = 3
+
+
+def read_bytes(path):
+    with open(path, 'rb') as file_connection:
+        content = file_connection.read()
+    return content
+
+def read_file(path):
+    with open(path, mode = 'r', encoding = "utf8") as file_connection:
+        content = file_connection.read()
+    return content
+
+def write_file(path, text):
+    with open(path, 'w', encoding = 'utf8') as file_connection:
+        file_connection.write(text)
+    return True
+
+
+# The image name is part of the variants names, so it is
+# also part of the cache key
+def hash_image(content, name):
+    hasher = hashlib.sha256()
+    hasher.update(f"v{CACHE_VERSION}:{name}:".encode('utf8'))
+    hasher.update(content)
+    return hasher.hexdigest()
+
+
+def get_image_files(folders):
+    image_files = list()
+    for folder in folders:
+        if not Path(folder).is_dir():
+            continue
+        for path in sorted(Path(folder).rglob('*')):
+            if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS:
+                image_files.append(str(path))
+    return image_files
+
+
+def get_web_mode(image):
+    has_transparency = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    return 'RGBA' if has_transparency else 'RGB'
+
+
+# The color profile of the original image is kept in every output, otherwise
+# colour-managed images would change their colors. When the image changes its
+# color space (e.g. CMYK to RGB), the pixels are converted to sRGB through
+# the profile, and the old profile is dropped, because it does not describe
+# the new pixels anymore
+def convert_mode(image, mode):
+    icc_profile = image.info.get('icc_profile')
+    if image.mode == mode:
+        return image, icc_profile
+    if icc_profile and image.mode == 'CMYK':
+        try:
+            source_profile = ImageCms.ImageCmsProfile(io.BytesIO(icc_profile))
+            srgb_profile = ImageCms.createProfile('sRGB')
+            converted = ImageCms.profileToProfile(image, source_profile, srgb_profile, outputMode = 'RGB')
+            return converted.convert(mode), None
+        except ImageCms.PyCMSError:
+            pass
+    # Palette images store RGB colors, so their profile is still valid
+    if image.mode in ('P', 'PA', 'RGB', 'RGBA'):
+        return image.convert(mode), icc_profile
+    return image.convert(mode), None
+
+
+def save_optimized(image, path, format):
+    icc_profile = image.info.get('icc_profile')
+    if format == 'PNG':
+        image.save(path, format = 'PNG', optimize = True, icc_profile = icc_profile)
+        return
+    if image.mode not in ('RGB', 'L'):
+        image, icc_profile = convert_mode(image, 'RGB')
+    image.save(
+        path, format = 'JPEG', optimize = True, progressive = True,
+        quality = JPEG_QUALITY, icc_profile = icc_profile
+    )
+
+
+def save_webp(image, path, lossless, icc_profile = None):
+    if lossless:
+        image.save(path, format = 'WEBP', lossless = True, method = 6, icc_profile = icc_profile)
+    else:
+        image.save(path, format = 'WEBP', quality = WEBP_QUALITY, method = 6, icc_profile = icc_profile)
+
+
+def build_cache_entry(path, entry_folder):
+    image_path = Path(path)
+    stem = image_path.stem
+    tmp_folder = Path(str(entry_folder) + '.tmp')
+    shutil.rmtree(tmp_folder, ignore_errors = True)
+    tmp_folder.mkdir(parents = True)
+
+    with Image.open(path) as image:
+        image.load()
+        format = 'PNG' if image.format == 'PNG' else 'JPEG'
+        # PNG files are recompressed losslessly, and JPEG files are
+        # recompressed (near-losslessly) with a high quality setting
+        lossless = format == 'PNG'
+        width, height = image.size
+
+        # The recompressed file is only kept if it is smaller than the original
+        optimized_path = tmp_folder / image_path.name
+        save_optimized(image, optimized_path, format)
+        if optimized_path.stat().st_size >= image_path.stat().st_size:
+            shutil.copyfile(path, optimized_path)
+
+        # Palette and grayscale images are converted to RGB(A) before being
+        # resized, because Pillow resizes palette images with NEAREST,
+        # which makes the text of the diagrams aliased
+        web_image, icc_profile = convert_mode(image, get_web_mode(image))
+        variants = [{'file': f"{stem}.webp", 'width': width}]
+        save_webp(web_image, tmp_folder / f"{stem}.webp", lossless, icc_profile)
+        full_size = (tmp_folder / f"{stem}.webp").stat().st_size
+        for target_width in RESPONSIVE_WIDTHS:
+            if target_width >= width:
+                continue
+            target_height = max(1, round(height * target_width / width))
+            resized = web_image.resize((target_width, target_height), Image.LANCZOS)
+            variant_path = tmp_folder / f"{stem}-{target_width}w.webp"
+            save_webp(resized, variant_path, lossless, icc_profile)
+            # A resized variant that is not smaller than the full size
+            # image is useless for the browser
+            if variant_path.stat().st_size >= full_size:
+                variant_path.unlink()
+                continue
+            variants.append({'file': variant_path.name, 'width': target_width})
+
+    manifest = {
+        'image': image_path.name,
+        'width': width,
+        'height': height,
+        'variants': sorted(variants, key = lambda x: x['width'])
+    }
+    write_file(str(tmp_folder / 'manifest.json'), json.dumps(manifest, indent = 2))
+    # Rename at the end, so an interrupted execution never leaves a
+    # half written entry inside the cache
+    shutil.rmtree(entry_folder, ignore_errors = True)
+    os.replace(tmp_folder, entry_folder)
+    return manifest
+
+
+def copy_from_cache(entry_folder, manifest, path):
+    image_path = Path(path)
+    files = [manifest['image']] + [variant['file'] for variant in manifest['variants']]
+    for file in files:
+        shutil.copyfile(Path(entry_folder) / file, image_path.parent / file)
+
+
+def optimize_image(path):
+    content = read_bytes(path)
+    name = Path(path).name
+    content_hash = hash_image(content, name)
+    entry_folder = Path(CACHE_FOLDER) / content_hash
+    manifest_path = entry_folder / 'manifest.json'
+    if manifest_path.exists():
+        manifest = json.loads(read_file(str(manifest_path)))
+        copy_from_cache(entry_folder, manifest, path)
+        return {'path': path, 'cached': True, 'manifest': manifest}
+
+    manifest = build_cache_entry(path, entry_folder)
+    copy_from_cache(entry_folder, manifest, path)
+
+    # The optimized image replaces the original one inside `docs/`, so
+    # its hash is also registered, to make the next execution a cache hit
+    optimized_hash = hash_image(read_bytes(path), name)
+    optimized_folder = Path(CACHE_FOLDER) / optimized_hash
+    if optimized_hash != content_hash and not optimized_folder.exists():
+        shutil.copytree(entry_folder, optimized_folder, dirs_exist_ok = True)
+
+    return {'path': path, 'cached': False, 'manifest': manifest, 'original_size': len(content)}
+
+
+def group_by_hash(image_files):
+    # Identical images (same name and content) in different folders share
+    # the same cache entry, so only one of them is sent to the workers
+    groups = dict()
+    for path in image_files:
+        content_hash = hash_image(read_bytes(path), Path(path).name)
+        groups.setdefault(content_hash, list()).append(path)
+    return groups
+
+
+def build_srcset(src, manifest):
+    folder = src.rsplit('/', 1)[0] + '/' if '/' in src else ''
+    candidates = [f"{folder}{variant['file']} {variant['width']}w" for variant in manifest['variants']]
+    return ', '.join(candidates)
+
+
+def build_sizes(manifest):
+    width = min(manifest['width'], CONTENT_WIDTH)
+    return f"(max-width: {width}px) 100vw, {width}px"
+
+
+def get_html_files(folder):
+    return [str(x) for x in sorted(Path(folder).rglob('*.html')) if x.is_file()]
+
+
+def add_srcset(html_path, manifests):
+    html_file = BeautifulSoup(read_file(html_path), features = "html.parser")
+    html_folder = Path(html_path).parent
+    changed = False
+    for node in html_file.find_all("img"):
+        src = node.get('src')
+        if src is None or re.match(r'^(https?:)?//|^data:', src):
+            continue
+        image_path = os.path.normpath(html_folder / src)
+        manifest = manifests.get(image_path)
+        if manifest is None:
+            continue
+
+        srcset = build_srcset(src, manifest)
+        if node.get('srcset') == srcset:
+            continue
+        node['srcset'] = srcset
+        if node.get('width') is None:
+            node['sizes'] = build_sizes(manifest)
+        else:
+            node['sizes'] = f"{node['width']}px"
+        # The cover image is above the fold, so it should not be lazy loaded
+        if 'quarto-cover-image' not in node.get('class', []):
+            node['loading'] = node.get('loading', 'lazy')
+        node['decoding'] = node.get('decoding', 'async')
+        changed = True
+
+    if changed:
+        write_file(html_path, str(html_file))
+    return changed
+
+
+if __name__ == '__main__':
+    Path(CACHE_FOLDER).mkdir(parents = True, exist_ok = True)
+    image_files = get_image_files(IMAGE_FOLDERS)
+    print(f"[INFO]: Found {len(image_files)} images to optimize...")
+
+    groups = group_by_hash(image_files)
+    manifests = dict()
+    with ProcessPoolExecutor() as executor:
+        unique_files = [paths[0] for paths in groups.values()]
+        for content_hash, result in zip(groups.keys(), executor.map(optimize_image, unique_files)):
+            path = result['path']
+            manifests[os.path.normpath(path)] = result['manifest']
+            if result['cached']:
+                print(f"[INFO]: Image {path} found in cache, skipping...")
+            else:
+                new_size = os.path.getsize(path)
+                print(f"[INFO]: Optimized {path} ({result['original_size']} -> {new_size} bytes)")
+
+            for duplicate in groups[content_hash][1:]:
+                entry_folder = Path(CACHE_FOLDER) / content_hash
+                copy_from_cache(entry_folder, result['manifest'], duplicate)
+                manifests[os.path.normpath(duplicate)] = result['manifest']
+                print(f"[INFO]: Image {duplicate} is identical to {path}, copied from cache...")
+
+    for html_path in get_html_files(DOCS_FOLDER):
+        if add_srcset(html_path, manifests):
+            print(f"[INFO]: Added responsive images to {html_path}...")
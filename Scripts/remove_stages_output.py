@@ -8,7 +8,6 @@ def get_html_chapter_files(folder):
     return [str(x) for x in chapters_files if x.is_file() and x.name.endswith('html')]
 
 chapters_folder = "./docs/Chapters/"
-chapters_files = get_html_chapter_files(chapters_folder)
 
 
 def read_file(path):
@@ -40,6 +39,8 @@ def rewrite_without_stages(path):
     return
 
 
-for path in chapters_files:
-    print(f"[INFO]: Rewriting {path}...")
-    rewrite_without_stages(path)
+if __name__ == '__main__':
+    chapters_files = get_html_chapter_files(chapters_folder)
+    for path in chapters_files:
+        print(f"[INFO]: Rewriting {path}...")
+        rewrite_without_stages(path)
@@ -0,0 +1,341 @@
+import os
+import re
+import sys
+import time
+import queue
+import signal
+import subprocess
+import multiprocessing
+from pathlib import Path
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+# This script should be executed from the root folder of the project, with
+# the output formats to rebuild as arguments (`html` is used by default):
+#
+#   python Scripts/watch_book.py html pdf
+#
+# It watches the sources of the book, and after each burst of saves, it
+# renders and cleans only the chapters affected by the changed files.
+QUARTO_CONFIG_PATH = "./_quarto.yml"
+DOCS_FOLDER = "./docs/"
+WATCHED_FOLDERS = ["./Chapters/", "./Data/"]
+WATCHED_FILES = ["./_quarto.yml", "./theme.scss", "./index.qmd"]
+# Script that compiles the cleaned `.tex` file into the PDF book
+COMPILE_PDF_SCRIPT = "./Scripts/compile_pdf_tex.R"
+SUPPORTED_FORMATS = ['html', 'pdf']
+# Time (in seconds) without new changes before a rebuild starts
+DEBOUNCE_SECONDS = 0.5
+# Time (in seconds) between each scan of the files, when inotify is not available
+POLLING_INTERVAL = 1.0
+# Extensions of the temporary files written by editors, which are ignored
+IGNORED_SUFFIXES = ('~', '.swp', '.swx', '.tmp')
+
+
+
+def is_ignored(path):
+    name = Path(path).name
+    return name.startswith('.#') or name.endswith(IGNORED_SUFFIXES)
+
+
+def list_watched_files():
+    files = [Path(x) for x in WATCHED_FILES if Path(x).is_file()]
+    for folder in WATCHED_FOLDERS:
+        if Path(folder).is_dir():
+            files.extend(x for x in Path(folder).rglob('*') if x.is_file())
+    return [os.path.normpath(x) for x in files if not is_ignored(x)]
+
+
+def take_snapshot():
+    snapshot = dict()
+    for path in list_watched_files():
+        stat = os.stat(path)
+        snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def create_polling_watcher():
+    return {'kind': 'polling', 'snapshot': take_snapshot()}
+
+
+def create_inotify_watcher():
+    inotify = INotify()
+    mask = flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE | flags.DELETE | flags.MOVED_FROM
+    folders = dict()
+    # The root folder is watched to catch the changes on the files
+    # listed at `WATCHED_FILES`
+    for folder in WATCHED_FOLDERS + ['.']:
+        if Path(folder).is_dir():
+            wd = inotify.add_watch(folder, mask)
+            folders[wd] = folder
+    return {'kind': 'inotify', 'inotify': inotify, 'folders': folders}
+
+
+def create_watcher():
+    if INotify is not None:
+        try:
+            return create_inotify_watcher()
+        except OSError as error:
+            print(f"[WARNING]: Could not start inotify ({error}), using polling instead...")
+    else:
+        print("[WARNING]: `inotify_simple` package not found, using polling instead...")
+    return create_polling_watcher()
+
+
+def wait_polling_changes(watcher, timeout):
+    time.sleep(timeout)
+    old_snapshot = watcher['snapshot']
+    new_snapshot = take_snapshot()
+    watcher['snapshot'] = new_snapshot
+    paths = set(old_snapshot) | set(new_snapshot)
+    return set(x for x in paths if old_snapshot.get(x) != new_snapshot.get(x))
+
+
+def wait_inotify_changes(watcher, timeout):
+    watched_files = set(os.path.normpath(x) for x in WATCHED_FILES)
+    changes = set()
+    for event in watcher['inotify'].read(timeout = int(timeout * 1000)):
+        folder = watcher['folders'].get(event.wd)
+        if folder is None or event.name == '':
+            continue
+        path = os.path.normpath(os.path.join(folder, event.name))
+        if folder == '.' and path not in watched_files:
+            continue
+        if not is_ignored(path):
+            changes.add(path)
+    return changes
+
+
+def wait_changes(watcher, timeout):
+    if watcher['kind'] == 'inotify':
+        return wait_inotify_changes(watcher, timeout)
+    return wait_polling_changes(watcher, timeout)
+
+
+
+def list_chapters():
+    # The chapters of the book are the `.qmd` files listed at `book.chapters`
+    # inside `_quarto.yml`, other files at `Chapters/` are not part of the book
+    with open(QUARTO_CONFIG_PATH, mode = 'r', encoding = "utf8") as file_connection:
+        lines = file_connection.read().split('\n')
+
+    chapters = list()
+    chapters_indent = None
+    for line in lines:
+        indent = len(line) - len(line.lstrip())
+        if re.match(r'^\s*chapters:\s*$', line) and chapters_indent is None:
+            chapters_indent = indent
+            continue
+        if chapters_indent is None or line.strip() == '':
+            continue
+        if indent <= chapters_indent and not line.lstrip().startswith('-'):
+            break
+        item = re.match(r'^\s*-\s*(\S+\.qmd)\s*$', line)
+        if item:
+            chapters.append(os.path.normpath(item.group(1)))
+    return chapters
+
+
+def chapters_using_file(path):
+    # A chapter depends on a data file if the chapter mentions it
+    data_reference = 'Data/' + Path(path).name
+    chapters = list()
+    for chapter in list_chapters():
+        with open(chapter, mode = 'r', encoding = "utf8") as file_connection:
+            if data_reference in file_connection.read():
+                chapters.append(chapter)
+    return chapters
+
+
+def find_affected_outputs(changes, formats):
+    chapters = set()
+    render_all = False
+    render_pdf = False
+    for path in changes:
+        if path == os.path.normpath("./_quarto.yml"):
+            render_all = True
+            render_pdf = True
+        elif path == os.path.normpath("./theme.scss"):
+            # The theme only affects the HTML output of the book
+            render_all = True
+        elif path in list_chapters():
+            if Path(path).exists():
+                chapters.add(path)
+                render_pdf = True
+        elif Path(path).parts[0] == 'Data':
+            data_chapters = chapters_using_file(path)
+            chapters.update(data_chapters)
+            render_pdf = render_pdf or len(data_chapters) > 0
+
+    if render_all:
+        chapters = set(list_chapters())
+    return {
+        'chapters': chapters if 'html' in formats else set(),
+        'render_all': render_all,
+        'pdf': render_pdf and 'pdf' in formats
+    }
+
+
+def merge_jobs(job, other_job):
+    return {
+        'chapters': job['chapters'] | other_job['chapters'],
+        'render_all': job['render_all'] or other_job['render_all'],
+        'pdf': job['pdf'] or other_job['pdf']
+    }
+
+
+
+def restore_sigint():
+    # The worker ignores SIGINT, and the children would inherit this,
+    # so the default handler is restored to make Ctrl-C stop a render
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+
+def run_command(command):
+    print(f"[INFO]: Running `{' '.join(command)}`...")
+    try:
+        result = subprocess.run(command, preexec_fn = restore_sigint)
+    except OSError as error:
+        print(f"[ERROR]: Could not run `{' '.join(command)}`: {error}")
+        return False
+    # A command stopped by Ctrl-C also stops the rebuild
+    if result.returncode in (-signal.SIGINT, 128 + signal.SIGINT):
+        raise KeyboardInterrupt
+    if result.returncode != 0:
+        print(f"[ERROR]: `{' '.join(command)}` failed with exit code {result.returncode}")
+        return False
+    return True
+
+
+def run_quarto(arguments):
+    return run_command(['quarto', 'render'] + arguments)
+
+
+def rebuild_html(job, rewrite_without_stages):
+    if job['render_all']:
+        chapters = list_chapters()
+        rendered = run_quarto(['--to', 'html'])
+        rendered_chapters = chapters if rendered else []
+    else:
+        chapters = sorted(job['chapters'])
+        # A chapter that fails to render does not block the cleanup of the others
+        rendered_chapters = [chapter for chapter in chapters if run_quarto([chapter, '--to', 'html'])]
+
+    for chapter in rendered_chapters:
+        html_path = os.path.join(DOCS_FOLDER, str(Path(chapter).with_suffix('.html')))
+        if Path(html_path).exists():
+            print(f"[INFO]: Rewriting {html_path}...")
+            rewrite_without_stages(html_path)
+
+
+def rebuild_pdf(clean_tex_file, tex_file_path):
+    # The PDF is a single document, so the whole book is always rendered.
+    # The old `.tex` file is removed first, so a stale file is never cleaned
+    if Path(tex_file_path).exists():
+        os.remove(tex_file_path)
+    if not run_quarto(['--to', 'pdf', '-M', 'keep-tex:true']):
+        return
+    if not Path(tex_file_path).exists():
+        print(f"[WARNING]: `{tex_file_path}` was not found after the render, skipping the PDF cleanup...")
+        return
+
+    clean_tex_file(tex_file_path)
+    run_command(['Rscript', COMPILE_PDF_SCRIPT])
+
+
+def run_worker(jobs):
+    # Ctrl-C is handled by the main process, which stops this worker
+    # by sending `None` through the queue
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # The cleanup scripts (and their parsers) are imported only once, and
+    # stay loaded in this process between rebuilds
+    from remove_stages_output import rewrite_without_stages
+    from clean_pdf_outputs import clean_tex_file, TEX_FILE_PATH
+    print("[INFO]: Rebuild worker is ready...")
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        # Merge all the jobs that arrived while the previous rebuild was running
+        try:
+            while True:
+                next_job = jobs.get_nowait()
+                if next_job is None:
+                    return
+                job = merge_jobs(job, next_job)
+        except queue.Empty:
+            pass
+
+        start = time.perf_counter()
+        try:
+            if job['chapters']:
+                run_step(rebuild_html, job, rewrite_without_stages)
+            if job['pdf']:
+                run_step(rebuild_pdf, clean_tex_file, TEX_FILE_PATH)
+        except KeyboardInterrupt:
+            return
+        elapsed = time.perf_counter() - start
+        print(f"[INFO]: Rebuild finished in {elapsed:.1f} seconds")
+
+
+def run_step(step, *arguments):
+    # An error in one rebuild must not kill the worker, otherwise
+    # all the next changes would never be rebuilt
+    try:
+        step(*arguments)
+    except Exception as error:
+        print(f"[ERROR]: `{step.__name__}` failed: {type(error).__name__}: {error}")
+
+
+def start_worker():
+    jobs = multiprocessing.Queue()
+    worker = multiprocessing.Process(target = run_worker, args = (jobs,), daemon = True)
+    worker.start()
+    return worker, jobs
+
+
+def watch(formats):
+    worker, jobs = start_worker()
+
+    watcher = create_watcher()
+    print(f"[INFO]: Watching {', '.join(WATCHED_FOLDERS + WATCHED_FILES)} ({watcher['kind']})...")
+    pending = set()
+    try:
+        while True:
+            timeout = DEBOUNCE_SECONDS if pending or watcher['kind'] == 'inotify' else POLLING_INTERVAL
+            changes = wait_changes(watcher, timeout)
+            if changes:
+                pending.update(changes)
+                continue
+            if not pending:
+                continue
+
+            job = find_affected_outputs(pending, formats)
+            pending = set()
+            if job['chapters'] or job['pdf']:
+                chapters = ', '.join(sorted(Path(x).name for x in job['chapters']))
+                print(f"[INFO]: Changes detected, rebuilding {chapters or 'the PDF book'}...")
+                if not worker.is_alive():
+                    print(f"[WARNING]: Rebuild worker stopped (exit code {worker.exitcode}), restarting it...")
+                    worker, jobs = start_worker()
+                jobs.put(job)
+    except KeyboardInterrupt:
+        print("[INFO]: Stopping watch mode...")
+    finally:
+        jobs.put(None)
+        worker.join(timeout = 10)
+        if worker.is_alive():
+            worker.terminate()
+
+
+
+if __name__ == '__main__':
+    formats = sys.argv[1:] or ['html']
+    for format in formats:
+        if format not in SUPPORTED_FORMATS:
+            raise Exception(f"Format `{format}` is not supported! Use one of: {', '.join(SUPPORTED_FORMATS)}")
+    watch(formats)